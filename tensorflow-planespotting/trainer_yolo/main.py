@@ -130,12 +130,19 @@ def start_training(output_dir, hparams, data, tiledata, **kwargs):
     logging.log(logging.INFO, "GPUs found: " + str(get_available_gpus()))
     distribution = tf.contrib.distribute.MirroredStrategy() if len(get_available_gpus()) > 1 else None
 
+    # Enable XLA auto-clustering. The box utilities and the YOLO loss are long chains
+    # of elementwise broadcast ops (subtracts, min/max, compares, selects) which XLA
+    # fuses into single kernels, eliminating most of the intermediate tensors.
+    session_config = tf.ConfigProto()
+    session_config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+
     training_config = tf.estimator.RunConfig(model_dir=output_dir,
                                              save_summary_steps=100,
                                              save_checkpoints_steps=hparams['iterations']//hparams['evaluations'],
                                              keep_checkpoint_max=1,
-                                             train_distribute=distribution)
-    #                                         session_config=config)  # device filters set here
+                                             train_distribute=distribution,
+                                             session_config=session_config)
+    #                                        device filters could also be set in session_config
 
     estimator = tf.estimator.Estimator(model_fn=model.model_fn,
                                        model_dir=output_dir,
@@ -0,0 +1,131 @@
+"""
+Copyright 2018 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+_______________________________________________________________________
+
+Unit tests for utils_box_np. To run the tests, execute
+python -m unittest discover -s trainer_yolo"""
+
+import numpy as np
+import unittest
+from trainer_yolo.utils_box_np import *
+
+
+class BoxRoiNumpyUtilsTest(unittest.TestCase):
+
+    def setUp(self):
+        # same test data as in test_utils_box.py
+        self.tile0 = np.array([3.0, 2.0, 7.0, 6.0], dtype=np.float32)  # format x1, y1, x2, y2
+        self.roi0 = np.array([4.3, 2.0, 7.0, 6.0], dtype=np.float32)
+        self.roi1 = np.array([2.5, 2.5, 4.7, 4.2], dtype=np.float32)
+        self.roi2 = np.array([3.1, 2.1, 3.2, 2.2], dtype=np.float32)
+        self.roi3 = np.array([3.0, 2.1, 3.2, 2.2], dtype=np.float32)
+        self.roi4 = np.array([5.0, 2.5, 6.5, 6.0], dtype=np.float32)
+        self.rois = np.array([[3.1, 1.5, 4.3, 2.7],
+                              [3.0, 2.0, 4.0, 3.0],
+                              [6.0, 5.0, 7.0, 6.0],
+                              [6.0, 5.0, 6.9, 5.9],
+                              [4.5, 3.1, 4.9, 3.5],
+                              [6.1, 5.1, 7.0, 6.0]], dtype=np.float32)
+        self.rois_1 = np.array([[3.0, 2.0, 4.0, 3.0]], dtype=np.float32)
+        self.rois_0 = np.zeros([0, 4], dtype=np.float32)
+
+    def test_boxintersect_np(self):
+        res1 = boxintersect_np(self.roi0, self.rois)
+        res2 = boxintersect_np(self.roi1, self.rois)
+        res3 = boxintersect_np(self.roi1, self.rois, 0.4999)  # 50% intersect min to count
+        res4 = boxintersect_np(self.roi2, self.rois)
+        res5 = boxintersect_np(self.roi3, self.rois)
+        res6 = boxintersect_np(self.roi3, self.rois, 0.51)
+        res7 = boxintersect_np(self.roi3, self.rois, 0.49)
+        res8 = boxintersect_np(self.roi4, self.rois)
+        res9 = boxintersect_np(self.roi4, self.rois, 0.49)
+        lcorrect1 = np.array([False, False, True, True, True, True])
+        lcorrect2 = np.array([True, True, False, False, True, False])
+        lcorrect3 = np.array([False, True, False, False, True, False])
+        lcorrect4 = np.array([True, True, False, False, False, False])
+        lcorrect5 = np.array([True, True, False, False, False, False])
+        lcorrect6 = np.array([False, True, False, False, False, False])
+        lcorrect7 = np.array([True, True, False, False, False, False])
+        lcorrect8 = np.array([False, False, True, True, False, True])
+        lcorrect9 = np.array([False, False, True, True, False, False])
+        self.assertTrue(np.array_equal(res1, lcorrect1), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res2, lcorrect2), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res3, lcorrect3), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res4, lcorrect4), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res5, lcorrect5), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res6, lcorrect6), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res7, lcorrect7), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res8, lcorrect8), "Box intersection test failed")
+        self.assertTrue(np.array_equal(res9, lcorrect9), "Box intersection test failed")
+
+    def test_n_largest_rois_in_cell_np(self):
+        out3 = n_largest_rois_in_cell_np(self.tile0, self.rois, grid_n=4, n=3)
+        out2 = n_largest_rois_in_cell_np(self.tile0, self.rois, grid_n=4, n=2)
+        out1 = n_largest_rois_in_cell_np(self.tile0, self.rois, grid_n=4, n=1)
+        out_1 = n_largest_rois_in_cell_np(self.tile0, self.rois_1, grid_n=4, n=3)
+        out_0 = n_largest_rois_in_cell_np(self.tile0, self.rois_0, grid_n=4, n=3)
+
+        correct1 = np.zeros([4, 4, 1, 3], dtype=np.float32)
+        correct1[0, 0, 0] = [3.7, 2.1, 1.2]
+        correct1[1, 1, 0] = [4.7, 3.3, 0.4]
+        correct1[3, 3, 0] = [6.5, 5.5, 1.0]
+
+        correct2 = np.zeros([4, 4, 2, 3], dtype=np.float32)
+        correct2[0, 0] = [[3.7, 2.1, 1.2], [3.5, 2.5, 1.0]]
+        correct2[1, 1, 0] = [4.7, 3.3, 0.4]
+        correct2[3, 3] = [[6.5, 5.5, 1.0], [6.45, 5.45, 0.9]]
+
+        correct3 = np.zeros([4, 4, 3, 3], dtype=np.float32)
+        correct3[0, 0, 0:2] = [[3.7, 2.1, 1.2], [3.5, 2.5, 1.0]]
+        correct3[1, 1, 0] = [4.7, 3.3, 0.4]
+        correct3[3, 3] = [[6.5, 5.5, 1.0], [6.45, 5.45, 0.9], [6.55, 5.55, 0.9]]
+
+        correct_1 = np.zeros([4, 4, 3, 3], dtype=np.float32)
+        correct_1[0, 0, 0] = [3.5, 2.5, 1.0]
+
+        correct_0 = np.zeros([4, 4, 3, 3], dtype=np.float32)
+
+        d1 = np.linalg.norm(np.reshape(out1, [-1])-np.reshape(correct1, [-1]))
+        d2 = np.linalg.norm(np.reshape(out2, [-1])-np.reshape(correct2, [-1]))
+        d3 = np.linalg.norm(np.reshape(out3, [-1])-np.reshape(correct3, [-1]))
+        d_1 = np.linalg.norm(np.reshape(out_1, [-1])-np.reshape(correct_1, [-1]))
+        d_0 = np.linalg.norm(np.reshape(out_0, [-1])-np.reshape(correct_0, [-1]))
+        self.assertTrue(d1 < 1e-6, "n_largest_rois_in_cell_np generation test failed")
+        self.assertTrue(d2 < 1e-6, "n_largest_rois_in_cell_np generation test failed")
+        self.assertTrue(d3 < 1e-6, "n_largest_rois_in_cell_np generation test failed")
+        self.assertTrue(d_1 < 1e-6, "n_largest_rois_in_cell_np generation test failed")
+        self.assertTrue(d_0 < 1e-6, "n_largest_rois_in_cell_np generation test failed")
+
+    def test_n_largest_rois_in_cell_np_boundaries(self):
+        tile = np.array([0.0, 0.0, 1.0, 1.0], dtype=np.float32)  # the attribution tile
+        # roi centered exactly on the edge between cells (0,0) and (0,1):
+        # the half-open cell interval attributes it to exactly one cell, the right one
+        rois = np.array([[0.15, 0.1, 0.35, 0.3]], dtype=np.float32)  # center (0.25, 0.2)
+        out = n_largest_rois_in_cell_np(tile, rois, grid_n=4, n=2)
+        nonzero_cells = np.argwhere(out[..., 2] > 0)
+        self.assertTrue(len(nonzero_cells) == 1 and tuple(nonzero_cells[0][:2]) == (0, 1),
+                        "boundary-centered roi must be attributed to exactly one cell")
+        # zero-width roi centered in a cell is kept as (cx, cy, 0), not dropped
+        rois = np.array([[0.3, 0.3, 0.3, 0.3]], dtype=np.float32)
+        out = n_largest_rois_in_cell_np(tile, rois, grid_n=4, n=1)
+        self.assertTrue(abs(out[1, 1, 0, 0] - 0.3) < 1e-6 and out[1, 1, 0, 2] == 0.0,
+                        "zero-width centered roi must keep its center coordinates")
+        # roi exactly at the cell center scores 0 under furthest_from_center but stays selected
+        rois = np.array([[0.3, 0.3, 0.45, 0.45]], dtype=np.float32)  # center of cell (1,1)
+        out = n_largest_rois_in_cell_np(tile, rois, grid_n=4, n=1, comparator="furthest_from_center")
+        self.assertTrue(out[1, 1, 0, 2] > 0, "cell-centered roi must be selected")
+
+if __name__ == '__main__':
+    unittest.main()
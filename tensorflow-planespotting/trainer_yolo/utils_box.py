@@ -17,28 +17,20 @@ _______________________________________________________________________
 Utility functions for rectangle manipulation in Tensorflow. Unit tests
 are available for all functions."""
 
-from builtins import zip
+import functools
+import numpy as np
 import tensorflow as tf
 
-def one_d_intersect(px1, px2, qx1, qx2):
-    # this assumes px2>=px1 and qx2>=qx1
-
-    # force broadcasting
-    px1 = tf.add(px1, qx1-qx1)
-    px2 = tf.add(px2, qx2-qx2)
-    zeros = tf.subtract(px1, px1)
-
-    interA = tf.greater(px1, qx1)
-    interB = tf.greater(px2, qx1)
-    interC = tf.greater(px2, qx2)
-    interD = tf.greater(qx2, px1)
-    inter = tf.logical_and(interB, interD)
-
-    inter_x1 = tf.where(tf.logical_and(tf.logical_not(interA), interB), qx1, px1)
-    inter_x2 = tf.where(tf.logical_and(interC, interD), qx2, px2)
-    inter_w = inter_x2 - inter_x1
-    inter_w = tf.where(inter, inter_w, zeros)  # for consistency
-    return inter, inter_x1, inter_w
+# tf.function appeared with eager execution in recent Tensorflow versions. When it is
+# available, it traces the decorated function once per combination of Python-side
+# parameters (grid_n, n, comparator, ...) and caches the resulting graph instead of
+# re-running the Python graph-building code on every call. On graph-mode Tensorflow 1.x
+# the decorator is a no-op: the graph is only built once per session anyway.
+if hasattr(tf, "function"):
+    _tf_function = tf.function
+else:
+    def _tf_function(func):
+        return func
 
 def boxintersect(primeroi, rois, min_intersect=0):
     # primeroi: single region shape=[4] Tensor: [x1, y1, x2, y2]
@@ -49,37 +41,43 @@ def boxintersect(primeroi, rois, min_intersect=0):
 
     px1, py1, px2, py2 = tf.unstack(primeroi, axis=0)
     x1, y1, x2, y2 = tf.unstack(rois, axis=1)
-    is_inter_x, inter_x, inter_w = one_d_intersect(px1, px2, x1, x2)
-    is_inter_y, inter_y, inter_h = one_d_intersect(py1, py2, y1, y2)
+    # classical axis-aligned box intersection: the overlap rectangle is
+    # [max(x1s), max(y1s)] x [min(x2s), min(y2s)], with sides clamped at zero
+    inter_w = tf.maximum(tf.minimum(px2, x2) - tf.maximum(px1, x1), 0.0)  # broadcast
+    inter_h = tf.maximum(tf.minimum(py2, y2) - tf.maximum(py1, y1), 0.0)  # broadcast
     inter_area = inter_w * inter_h
     parea = (px2-px1)*(py2-py1)
     areas = (x2-x1)*(y2-y1)
     min_areas = tf.minimum(areas, parea)
-    inter = tf.logical_and(is_inter_x, is_inter_y)
+    # boxes touching only on an edge or a corner do not count as intersecting
+    inter = tf.logical_and(tf.greater(inter_w, 0.0), tf.greater(inter_h, 0.0))
     inter_with_area = tf.greater_equal(inter_area, min_areas*min_intersect)
     return tf.logical_and(inter, inter_with_area)
 
+@functools.lru_cache(maxsize=None)
+def _gen_grid_np(grid_n):
+    # the grid only depends on grid_n: compute it once and cache it
+    cell_x, cell_y = np.meshgrid(np.arange(grid_n), np.arange(grid_n))
+    return np.stack([cell_x, cell_y], axis=2).astype(np.float32)  # shape [grid_n, grid_n, 2]
+
 def gen_grid(grid_n):
-    cell_x = tf.range(0, grid_n, dtype=tf.float32)
-    cell_x = tf.tile(tf.expand_dims(cell_x, axis=0), [grid_n, 1])
-    cell_x = cell_x
-    cell_y = tf.range(0, grid_n, dtype=tf.float32)
-    cell_y = tf.tile(tf.expand_dims(cell_y, axis=0), [grid_n, 1])
-    cell_y = tf.transpose(cell_y)
-    cell_y = cell_y
-    grid = tf.stack([cell_x, cell_y], axis=2)  # shape [grid_n, grid_n, 2]
-    return grid
+    # precomputed in numpy and baked into the graph as a folded constant instead
+    # of being rebuilt from range/tile/transpose ops on every call
+    return tf.constant(_gen_grid_np(grid_n))
 
 def size_and_move_grid(grid, cell_w, origin):
     return grid * cell_w + origin
 
 def x1y1x2y2_to_cxcyw(rois):
-    rois_x1, rois_y1, rois_x2, rois_y2 = tf.unstack(rois, axis=1)  # rois shape [n, 4]
-    # center coordinates of the roi
-    rois_x = (rois_x1 + rois_x2) / 2.0
-    rois_y = (rois_y1 + rois_y2) / 2.0
-    rois_w = (rois_x2 - rois_x1)
-    rois = tf.stack([rois_x, rois_y, rois_w], axis=1) # rois shape [rois_n, 3]
+    # slices keep the coordinate dimension, so the results concat directly
+    # without the unstack/stack round-trip through separate tensors
+    rois_x1 = rois[:, 0:1]  # rois shape [n, 4]
+    rois_y1 = rois[:, 1:2]
+    rois_x2 = rois[:, 2:3]
+    rois_y2 = rois[:, 3:4]
+    rois = tf.concat([(rois_x1 + rois_x2) / 2.0,  # center coordinates of the roi
+                      (rois_y1 + rois_y2) / 2.0,
+                      rois_x2 - rois_x1], axis=1) # rois shape [rois_n, 3]
     return rois
 
 def xyw_to_x1y1x2y2(rois):
@@ -89,31 +87,52 @@ def xyw_to_x1y1x2y2(rois):
     rois = tf.stack([rois_x1, rois_y1, rois_x2, rois_y2], axis=1) # rois shape [n, 3]
     return rois
 
-def reshape_rois(rois, grid_n):
-    cross_rois = tf.expand_dims(tf.expand_dims(rois, axis=0), axis=0)
-    cross_rois = tf.tile(cross_rois, [grid_n, grid_n, 1, 1]) # shape [grid_n, grid_n, rois_n, 3]]
+def reshape_rois(rois):
+    # the leading size-1 dimensions broadcast against the [grid_n, grid_n] grid in all
+    # consumers, so the rois are never physically replicated per grid cell
+    cross_rois = tf.expand_dims(tf.expand_dims(rois, axis=0), axis=0) # shape [1, 1, rois_n, 3]]
     return cross_rois
 
+# returns the signed offsets from roi centers to grid cell centers, one pair of
+# [grid_n, grid_n, rois_n] tensors shared by the cell membership tests below
+def _center_offsets(grid, grid_n, cell_w, rois):
+    cross_rois = reshape_rois(rois) # shape [1, 1, rois_n, 3]]
+    cross_rois_cx = cross_rois[:, :, :, 0]  # shape [1, 1, rois_n]
+    cross_rois_cy = cross_rois[:, :, :, 1]
+    # grid slices keep the last dimension, which broadcasts against the rois dimension
+    cell_cx = grid[:, :, 0:1] + cell_w*0.5  # shape [grid_n, grid_n, 1]
+    cell_cy = grid[:, :, 1:2] + cell_w*0.5
+    dx = cross_rois_cx - cell_cx  # broadcast !
+    dy = cross_rois_cy - cell_cy  # broadcast !
+    return dx, dy
+
+# Half-open membership test [-half_w, half_w) on both signed offsets. The half-open
+# interval keeps grid cells a partition of the tile: a roi centered exactly on a
+# cell edge belongs to exactly one cell (the one on its right/below), so it is
+# never silently dropped from ground truth attribution.
+def _offsets_in_cell(dx, dy, half_w):
+    in_x = tf.logical_and(tf.greater_equal(dx, -half_w), tf.less(dx, half_w))
+    in_y = tf.logical_and(tf.greater_equal(dy, -half_w), tf.less(dy, half_w))
+    return tf.logical_and(in_x, in_y)
+
 # returns set of booleans stating if ROI is centered in grid cell
 # grid cells coordinates x,y represent top left corner of cell (not center)
 # if expand>1.0, expands cells before applying condition
 def center_in_grid_cell(grid, grid_n, cell_w, rois, expand=1.0):
-    cross_rois = reshape_rois(rois, grid_n) # shape [grid_n, grid_n, rois_n, 3]]
-    cross_rois_cx, cross_rois_cy, cross_rois_w = tf.unstack(cross_rois, axis=-1)
-    grid_x, grid_y = tf.unstack(grid, axis=-1)
-    has_center_x = tf.logical_and(tf.greater_equal(cross_rois_cx, tf.expand_dims(grid_x-(expand-1.0)*cell_w, -1)),  # broadcast !
-                                  tf.less(cross_rois_cx, tf.expand_dims(grid_x+expand*cell_w, -1)))    # broadcast ! and broadcast !
-    has_center_y = tf.logical_and(tf.greater_equal(cross_rois_cy, tf.expand_dims(grid_y-(expand-1.0)*cell_w, -1)),  # broadcast !
-                                  tf.less(cross_rois_cy, tf.expand_dims(grid_y+expand*cell_w, -1)))    # broadcast ! and broadcast !
-    has_center = tf.logical_and(has_center_x, has_center_y) # shape [grid_n, grid_n, rois_n]
+    dx, dy = _center_offsets(grid, grid_n, cell_w, rois)
+    # the (expanded) cell is the interval of half-width (2*expand-1)*cell_w/2 around the cell center
+    half_w = (2.0*expand - 1.0) * cell_w*0.5
+    has_center = _offsets_in_cell(dx, dy, half_w) # shape [grid_n, grid_n, rois_n]
     return has_center
 
 # returns set of booleans stating if ROI is centered in grid cell periphery
 # expand must be > 1.0 for this function to return positive results
 # True for rois centered in expanded cell but not in non-expanded cell.
 def center_in_grid_cell_periphery(grid, grid_n, cell_w, rois, expand=1.0):
-    has_center = center_in_grid_cell(grid, grid_n, cell_w, rois, expand=1.0)
-    has_center_expanded = center_in_grid_cell(grid, grid_n, cell_w, rois, expand=expand)
+    # both masks are derived from the same offset tensors in a single pass over the rois
+    dx, dy = _center_offsets(grid, grid_n, cell_w, rois)
+    has_center = _offsets_in_cell(dx, dy, cell_w*0.5)
+    has_center_expanded = _offsets_in_cell(dx, dy, (2.0*expand - 1.0) * cell_w*0.5)
     has_center_peri = tf.logical_and(has_center_expanded, tf.logical_not(has_center))
     return has_center_peri
 
@@ -134,6 +153,7 @@ def gen_grid_for_tile(tile, grid_n):
 # comparator="largest_w": largest roi by width
 # comparator="furthest_from_center": roi furthest from cell center
 # comparator="closest_to_center": roi closest to cell center
+@_tf_function
 def n_largest_rois_in_cell(tile, rois, rois_n, grid_n, n, comparator="largest_w", expand=1.0):
 
     # handle the case of rois_n == 0 by creating one dummy empty roi, otherwise the code will not work with rois_n=0
@@ -147,48 +167,50 @@ def n_largest_rois_in_cell(tile, rois, rois_n, grid_n, n, comparator="largest_w"
     # rois shape [rois_n, 3]
 
     rois = x1y1x2y2_to_cxcyw(rois)
-    cross_rois = reshape_rois(rois, grid_n)  # shape [grid_n, grid_n, rois_n, 3]]
-    cross_rois_cx, cross_rois_cy, cross_rois_w = tf.unstack(cross_rois, axis=-1) # shape [grid_n, grid_n, rois_n]]
+    cross_rois = reshape_rois(rois)  # shape [1, 1, rois_n, 3]]
+    cross_rois_cx = cross_rois[:, :, :, 0]  # shape [1, 1, rois_n], broadcasts on the grid
+    cross_rois_cy = cross_rois[:, :, :, 1]
+    cross_rois_w = cross_rois[:, :, :, 2]
     has_center = center_in_grid_cell(grid, grid_n, cell_w, rois, expand=expand)
 
     grid_centers = (grid + grid + cell_w) / 2.0  # shape [grid_n, grid_n, 2]
-    g_cx, g_cy = tf.unstack(grid_centers, axis=-1)  # shape [grid_n, grid_n]
-    g_cx = tf.expand_dims(g_cx, axis=-1) # force broadcasting on correct axis
-    g_cy = tf.expand_dims(g_cy, axis=-1)
-
-    # iterate on largest a fixed number of times to get N largest
-    n_largest = []
-    zeros = tf.zeros(shape=[grid_n, grid_n, 3])
-    for i in range(n):
-        any_roi_in_cell = tf.reduce_any(has_center, axis=2) # shape [grid_n, grid_n]
-        if comparator=="largest_w":
-            largest_indices = tf.argmax(tf.cast(has_center, tf.float32) * cross_rois_w, axis=2)  # shape [grid_n, grid_n]
-        elif comparator=="furthest_from_center":
-            d_from_cell_center = tf.abs(cross_rois_cx - g_cx) + tf.abs(cross_rois_cy - g_cy)
-            largest_indices = tf.argmax(tf.cast(has_center, tf.float32) * d_from_cell_center, axis=2)  # shape [grid_n, grid_n]
-        elif comparator=="closest_to_center":
-            d_from_cell_center = tf.abs(cross_rois_cx - g_cx) + tf.abs(cross_rois_cy - g_cy)
-            ones = tf.ones(tf.shape(d_from_cell_center))
-            largest_indices = tf.argmin(tf.where(has_center, d_from_cell_center, 1000*ones), axis=2)  # shape [grid_n, grid_n]
-        # as of TF1.3 can use tf.gather(axis=2)
-        rs_largest_indices = tf.reshape(largest_indices, [grid_n*grid_n])
-        rs_largest_indices = tf.unstack(rs_largest_indices, axis=0)  # list
-        rs_cross_rois = tf.reshape(cross_rois, [grid_n*grid_n, rois_n, 3])
-        rs_cross_rois = tf.unstack(rs_cross_rois, axis=0) # list
-        rs_largest_roi_in_cell = [tf.gather(cr, li) for cr, li in zip(rs_cross_rois, rs_largest_indices)]
-        largest_roi_in_cell = tf.stack(rs_largest_roi_in_cell, axis=0)  # shape [grid_n * grid_n, 3]
-        largest_roi_in_cell = tf.reshape(largest_roi_in_cell, [grid_n, grid_n, 3]) # shape [grid_n, grid_n, 3]
-        # cells that do not have a roi in them, set their "largest roi in cell" to (x=0,y=0,w=0)
-        any_roi_in_cell = tf.tile(tf.expand_dims(any_roi_in_cell, axis=-1), [1, 1, 3])  # shape [grid_n, grid_n, 3]
-        largest_roi_in_cell = tf.where(any_roi_in_cell, largest_roi_in_cell, zeros) # shape [grid_n, grid_n, 3]
-        n_largest.append(largest_roi_in_cell)
-        # zero-out the largest element per cell to get the next largest on the next iteration
-        zero_mask = tf.logical_not(tf.cast(tf.one_hot(largest_indices, rois_n), dtype=tf.bool))
-        has_center = tf.logical_and(has_center, zero_mask)
-    n_largest = tf.stack(n_largest, axis=2)  # shape [grid_n, grid_n, n, 3]
+    # slices keep the last dimension, which broadcasts on the rois dimension
+    g_cx = grid_centers[:, :, 0:1]  # shape [grid_n, grid_n, 1]
+    g_cy = grid_centers[:, :, 1:2]
+
+    # Score all rois per cell and select the n best in one top_k pass.
+    # (top_k sorts by decreasing score and breaks ties on the lowest index,
+    # which is the same ordering the iterative argmax selection produced.)
+    # Rois not centered in the cell score -inf through a select instead of a
+    # bool-to-float multiply: no cast, and a selected roi is valid exactly
+    # when its score is finite.
+    minus_inf = tf.fill(tf.shape(has_center), -1e30)
+    if comparator=="largest_w":
+        scores = tf.where(has_center, cross_rois_w + tf.zeros_like(minus_inf), minus_inf)  # broadcast to full shape
+    elif comparator=="furthest_from_center":
+        d_from_cell_center = tf.abs(cross_rois_cx - g_cx) + tf.abs(cross_rois_cy - g_cy)
+        scores = tf.where(has_center, d_from_cell_center, minus_inf)  # shape [grid_n, grid_n, rois_n]
+    elif comparator=="closest_to_center":
+        d_from_cell_center = tf.abs(cross_rois_cx - g_cx) + tf.abs(cross_rois_cy - g_cy)
+        scores = tf.where(has_center, -d_from_cell_center, minus_inf)  # shape [grid_n, grid_n, rois_n]
+
+    # n can be larger than the number of rois: pad so that top_k always has n
+    # candidates. The padding never wins, it also scores -inf.
+    pad_n = tf.maximum(n - rois_n, 0)
+    scores = tf.pad(scores, [[0, 0], [0, 0], [0, pad_n]], constant_values=-1e30)
+    rois = tf.pad(rois, [[0, pad_n], [0, 0]])
+
+    top_scores, top_indices = tf.nn.top_k(scores, k=n)  # shapes [grid_n, grid_n, n]
+    # every cell gathers from the same roi list, so a plain gather does the lookup
+    n_largest = tf.gather(rois, top_indices)  # shape [grid_n, grid_n, n, 3]
+    # slots that picked a roi not centered in the cell (or padding) become empty rois (0,0,0)
+    roi_valid = tf.greater(top_scores, -1e29)  # shape [grid_n, grid_n, n]
+    roi_valid = tf.tile(tf.expand_dims(roi_valid, axis=-1), [1, 1, 1, 3])  # shape [grid_n, grid_n, n, 3]
+    n_largest = tf.where(roi_valid, n_largest, tf.zeros_like(n_largest))
     return n_largest  # shape [grid_n, grid_n, n, 3]
 
 
+@_tf_function
 def make_rois_tile_cell_relative(tile, tiled_rois, grid_n):
     grid, cell_w = gen_grid_for_tile(tile, grid_n)
     tile_w = cell_w * grid_n
@@ -198,79 +220,80 @@ def make_rois_tile_cell_relative(tile, tiled_rois, grid_n):
     # compute grid cell centers
     grid_centers = (grid + grid + cell_w) / 2.0  # shape [grid_n, grid_n, 2]
 
-    gc_x, gc_y = tf.unstack(grid_centers, axis=-1)  # shape [grid_n, grid_n]
-    # force broadcasting on correct axis
-    gc_x = tf.expand_dims(gc_x, axis=-1)
-    gc_y = tf.expand_dims(gc_y, axis=-1)
-    tr_x, tr_y, tr_w = tf.unstack(tiled_rois, axis=-1) # shape [grid_n, grid_n, cell_n]
+    # slices keep the last dimension, which broadcasts on the cell_n dimension
+    gc_x = grid_centers[:, :, 0:1]  # shape [grid_n, grid_n, 1]
+    gc_y = grid_centers[:, :, 1:2]
+    tr_x = tiled_rois[:, :, :, 0]  # shape [grid_n, grid_n, cell_n]
+    tr_y = tiled_rois[:, :, :, 1]
+    tr_w = tiled_rois[:, :, :, 2]
 
     ctr_x = (tr_x - gc_x) / (cell_w/2.0)  # constrain x within [-1, 1] in cell center relative coordinates
     ctr_y = (tr_y - gc_y) / (cell_w/2.0)  # constrain y within [-1, 1] in cell center relative coordinates
     ctr_w = tr_w / tile_w  # constrain w within [0, 1] in tile-relative coordinates
 
-    # leave x, y coordinates unchanged (as 0) if the width is zero (empty box)
-    ctr_x = tf.where(tf.greater(tr_w, 0), ctr_x, tr_x)
-    ctr_y = tf.where(tf.greater(tr_w, 0), ctr_y, tr_x)
+    # Zero out the x, y coordinates if the width is zero (empty box). Empty boxes
+    # are (0,0,0) upstream, so one compare and two multiplies do the job of the
+    # two selects used before (the second of which fell back to tr_x instead of tr_y).
+    mask = tf.cast(tf.greater(tr_w, 0), tf.float32)
+    ctr_x = ctr_x * mask
+    ctr_y = ctr_y * mask
 
     rois = tf.stack([ctr_x, ctr_y, ctr_w], axis=-1)
     return rois
 
 
+@_tf_function
 def n_largest_rois_in_cell_relative(tile, rois, rois_n, grid_n, n, comparator="largest_w", expand=1.0):
     rois = n_largest_rois_in_cell(tile, rois, rois_n, grid_n, n, comparator=comparator, expand=expand)
     rois = make_rois_tile_cell_relative(tile, rois, grid_n)
     return rois
 
 
+# Decision table for n_experimental_roi_selection_strategy (n==2 specialization):
+# depending on which of [r1, r2, p1, p2] are non-zero in a cell, select which
+# two of them to emit:
+# normal_rois   periph_rois   result
+#    0     0      0     0      0    0   (a0)
+#    x     0      0     0      x    x   (a0)
+#    x     y      0     0      x    y   (a1)
+#    0     0      z     0      z    z   (a2)
+#    0     0      z     t      z    t   (a3)
+#    x     0      z     0      x    z   (a4)
+#    x     y      z     0      x    y   (a1)
+#    x     0      z     t      x    z   (a4)
+#    x     y      z     t      x    y   (a1)
+#
+# The table is indexed by the 4-bit code r1*8 + r2*4 + p1*2 + p2 (1 = non-zero roi).
+# Values are pairs of indices into [r1, r2, p1, p2]. It is evaluated once at module
+# load; only the constant op enters each graph.
+_ROI_SELECTION_TABLE = np.array([[0, 0],   # 0000 (a0)
+                                 [3, 3],   # 0001 (a5) cannot happen
+                                 [2, 2],   # 0010 (a2)
+                                 [2, 3],   # 0011 (a3)
+                                 [1, 1],   # 0100 (a7) cannot happen
+                                 [1, 3],   # 0101 (a8) cannot happen
+                                 [1, 2],   # 0110 (a9) cannot happen
+                                 [1, 2],   # 0111 (a9) cannot happen
+                                 [0, 0],   # 1000 (a0)
+                                 [0, 3],   # 1001 (a6) yes, can happen
+                                 [0, 2],   # 1010 (a4)
+                                 [0, 2],   # 1011 (a4)
+                                 [0, 1],   # 1100 (a1)
+                                 [0, 1],   # 1101 (a1) cannot happen
+                                 [0, 1],   # 1110 (a1)
+                                 [0, 1]],  # 1111 (a1)
+                                np.int32)
+
+
+@_tf_function
 def n_experimental_roi_selection_strategy(tile, rois, rois_n, grid_n, n, cell_grow):
     assert n == 2  # only implemented for CELL_B=2
     normal_rois = n_largest_rois_in_cell_relative(tile, rois, rois_n, grid_n, n, comparator="closest_to_center", expand=1.0)
     periph_rois = n_largest_rois_in_cell_relative(tile, rois, rois_n, grid_n, n, comparator="closest_to_center", expand=1.0*cell_grow)
 
-    # TODO: count number of non-zero rois in both, then use decision table
-    # normal_rois   periph_rois   result
-    #    0     0      0     0      0    0   (a0)
-    #    x     0      0     0      x    x   (a0)
-    #    x     y      0     0      x    y   (a1)
-    #    0     0      z     0      z    z   (a2)
-    #    0     0      z     t      z    t   (a3)
-    #    x     0      z     0      x    z   (a4)
-    #    x     y      z     0      x    y   (a1)
-    #    x     0      z     t      x    z   (a4)
-    #    x     y      z     t      x    y   (a1)
-
-    def roi_select(rois):
-        r1, r2, p1, p2 = tf.unstack(rois, axis=0)  # result shape [3]
-        a0 = tf.stack([r1, r1])
-        a1 = tf.stack([r1, r2])
-        a2 = tf.stack([p1, p1])
-        a3 = tf.stack([p1, p2])
-        a4 = tf.stack([r1, p1])
-        a5 = tf.stack([p2, p2])
-        a6 = tf.stack([r1, p2])
-        a7 = tf.stack([r2, r2])
-        a8 = tf.stack([r2, p2])
-        a9 = tf.stack([r2, p1])
-        _, _, w = tf.unstack(rois, axis=1)  # result shape [4]
-        nz = tf.greater(w, 0)
-        zero = tf.zeros(tf.shape(a0))
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, False, False, False])), a0, zero)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, False, False, True])), a5, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, False, True, False])), a2, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, False, True, True])), a3, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, True, False, False])), a7, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, True, False, True])), a8, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, True, True, False])), a9, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [False, True, True, True])), a9, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, False, False, False])), a0, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, False, False, True])), a6, r)  # yes, can happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, False, True, False])), a4, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, False, True, True])), a4, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, True, False, False])), a1, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, True, False, True])), a1, r)  # cannot happen
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, True, True, False])), a1, r)
-        r = tf.where(tf.reduce_all(tf.equal(nz, [True, True, True, True])), a1, r)
-        return r
+    # one tf.gather on the precomputed decision table per cell replaces the sixteen
+    # compare-and-select ops the previous map_fn implementation ran per cell
+    choice_table = tf.constant(_ROI_SELECTION_TABLE)
 
     rsnormal_rois = tf.reshape(normal_rois, [grid_n * grid_n, n, 3])
     rx, ry, rw = tf.unstack(rsnormal_rois, axis=-1)
@@ -280,8 +303,11 @@ def n_experimental_roi_selection_strategy(tile, rois, rois_n, grid_n, n, cell_gr
     zero = tf.zeros_like(pw)
     pw = tf.where(roi_exclude, zero, pw)  # keep in periphery rois only rois that are NOT in normal rois, i.e. rois further than 1 cell radius
     rsperiph_rois = tf.stack([px, py, pw], axis=2)
-    rscombined_rois = tf.concat([rsnormal_rois, rsperiph_rois], axis=1)
-    rscombined_rois = tf.map_fn(roi_select, rscombined_rois)
+    rscombined_rois = tf.concat([rsnormal_rois, rsperiph_rois], axis=1)  # shape [grid_n*grid_n, 4, 3]
+    nz = tf.cast(tf.greater(rscombined_rois[:, :, 2], 0), tf.int32)  # shape [grid_n*grid_n, 4]
+    code = nz[:, 0]*8 + nz[:, 1]*4 + nz[:, 2]*2 + nz[:, 3]  # shape [grid_n*grid_n]
+    selected = tf.gather(choice_table, code)  # shape [grid_n*grid_n, 2]
+    rscombined_rois = tf.batch_gather(rscombined_rois, selected)  # shape [grid_n*grid_n, 2, 3]
     combined_rois = tf.reshape(rscombined_rois, [grid_n, grid_n, n, 3])
     return combined_rois
 
@@ -305,26 +331,26 @@ def grid_cell_to_tile_coords(rois, grid_n, tile_size):
     # coordinates in last dimension are y1, x1, y2, x2
     # relatively to tile_size
 
-    # grid for (0,0) based tile of size tile_size
+    # grid for (0,0) based tile of size tile_size, baked in as a constant
     cell_w = tile_size/grid_n
-    grid = gen_grid(grid_n) * cell_w
+    grid = tf.constant(_gen_grid_np(grid_n) * cell_w)
     # grid cell centers
     grid_centers = (grid + grid + cell_w) / 2.0  # shape [grid_n, grid_n, 2]
     # roi coordinates
-    roi_cx, roi_cy, roi_w = tf.unstack(rois, axis=-1) # shape [batch, grid_n, grid_n, n]
-    # grid centers unstacked
-    gr_cx, gr_cy = tf.unstack(grid_centers, axis=-1) # shape [grid_n, grid_n]
-    gr_cx = tf.expand_dims(tf.expand_dims(gr_cx, 0), 3) # shape [1, grid_n, grid_n, 1]
-    gr_cy = tf.expand_dims(tf.expand_dims(gr_cy, 0), 3) # shape [1, grid_n, grid_n, 1]
-    roi_cx = roi_cx * cell_w/2 # roi_x=1 means cell center + cell_w/2
-    roi_cx = roi_cx+gr_cx
-    roi_cy = roi_cy * cell_w/2 # roi_x=1 means cell center + cell_w/2
-    roi_cy = roi_cy+gr_cy
-    roi_w = roi_w * tile_size
-    roi_x1 = roi_cx - roi_w/2
-    roi_x2 = roi_cx + roi_w/2
-    roi_y1 = roi_cy - roi_w/2
-    roi_y2 = roi_cy + roi_w/2
+    roi_cx = rois[:, :, :, :, 0] # shape [batch, grid_n, grid_n, n]
+    roi_cy = rois[:, :, :, :, 1]
+    roi_w = rois[:, :, :, :, 2]
+    # grid centers, shaped to broadcast on the batch and n dimensions
+    gr_cx = tf.reshape(grid_centers[:, :, 0], [1, grid_n, grid_n, 1])
+    gr_cy = tf.reshape(grid_centers[:, :, 1], [1, grid_n, grid_n, 1])
+    roi_cx = roi_cx * (cell_w/2) + gr_cx # roi_x=1 means cell center + cell_w/2
+    roi_cy = roi_cy * (cell_w/2) + gr_cy
+    # the half-width is computed once, each corner is then a single add or subtract
+    roi_hw = roi_w * (tile_size/2.0)
+    roi_x1 = roi_cx - roi_hw
+    roi_x2 = roi_cx + roi_hw
+    roi_y1 = roi_cy - roi_hw
+    roi_y2 = roi_cy + roi_hw
     rois = tf.stack([roi_x1, roi_y1, roi_x2, roi_y2], axis=4)  # shape [batch, grid_n, grid_n, n, 4]
     return rois
 
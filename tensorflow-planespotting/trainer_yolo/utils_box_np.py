@@ -0,0 +1,108 @@
+"""
+Copyright 2018 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+_______________________________________________________________________
+
+Numpy ports of the hottest rectangle utilities from utils_box.py, for use
+in Python-side data preparation. A tile holds at most a few dozen rois so
+the Tensorflow graph overhead dominates there; the vectorized numpy
+versions operate on plain arrays and return the same results as their
+Tensorflow counterparts. This module deliberately does not import
+Tensorflow."""
+
+import numpy as np
+
+
+def boxintersect_np(primeroi, rois, min_intersect=0):
+    # primeroi: single region, array [4]: x1, y1, x2, y2
+    # rois: multiple regions, array [n, 4]: n x [x1, y1, x2, y2]
+    # min_intersect: value between 0 and 1.
+    #   area(intersection) >= min_intersect * min(area(primeroi), area(roi)) to count as intersection
+    # return value: bool array [n] indicating which rois intersect the primeroi
+
+    primeroi = np.asarray(primeroi, np.float32)
+    rois = np.asarray(rois, np.float32).reshape([-1, 4])
+    px1, py1, px2, py2 = primeroi
+    x1, y1, x2, y2 = rois[:, 0], rois[:, 1], rois[:, 2], rois[:, 3]
+    # classical axis-aligned box intersection, as in boxintersect
+    inter_w = np.maximum(np.minimum(px2, x2) - np.maximum(px1, x1), 0.0)
+    inter_h = np.maximum(np.minimum(py2, y2) - np.maximum(py1, y1), 0.0)
+    inter_area = inter_w * inter_h
+    parea = (px2-px1)*(py2-py1)
+    areas = (x2-x1)*(y2-y1)
+    min_areas = np.minimum(areas, parea)
+    inter = np.logical_and(inter_w > 0.0, inter_h > 0.0)
+    return np.logical_and(inter, inter_area >= min_areas*min_intersect)
+
+
+def n_largest_rois_in_cell_np(tile, rois, grid_n, n, comparator="largest_w", expand=1.0):
+    # Numpy version of n_largest_rois_in_cell. Same semantics, except that the
+    # number of rois is read off the array so there is no rois_n argument.
+    # tile: array [4]: x1, y1, x2, y2
+    # rois: array [rois_n, 4]: rois_n x [x1, y1, x2, y2]
+    # return value: array [grid_n, grid_n, n, 3], rois as [cx, cy, w] per cell,
+    # ordered by decreasing score, padded with empty rois (0,0,0)
+
+    tile = np.asarray(tile, np.float32)
+    rois = np.asarray(rois, np.float32).reshape([-1, 4])
+    rois_n = rois.shape[0]
+    tile_x1, tile_y1, tile_x2, _ = tile
+    cell_w = (tile_x2 - tile_x1) / grid_n
+
+    # roi centers and widths (rectangular rois become squares, as in the TF version)
+    cx = (rois[:, 0] + rois[:, 2]) / 2.0
+    cy = (rois[:, 1] + rois[:, 3]) / 2.0
+    w = rois[:, 2] - rois[:, 0]
+    cxyw = np.stack([cx, cy, w], axis=1)  # shape [rois_n, 3]
+
+    # Signed offsets from roi centers to cell centers. As in center_in_grid_cell,
+    # the (expanded) cell is the half-open interval [-half_w, half_w) around its
+    # center on both axes, so a roi centered exactly on a cell edge belongs to
+    # exactly one cell.
+    gx, gy = np.meshgrid(np.arange(grid_n), np.arange(grid_n))
+    cell_cx = tile_x1 + gx * cell_w + cell_w*0.5  # shape [grid_n, grid_n]
+    cell_cy = tile_y1 + gy * cell_w + cell_w*0.5
+    dx = cx - cell_cx[..., None]  # shape [grid_n, grid_n, rois_n], broadcast !
+    dy = cy - cell_cy[..., None]
+    half_w = (2.0*expand - 1.0) * cell_w*0.5
+    has_center = np.logical_and(np.logical_and(dx >= -half_w, dx < half_w),
+                                np.logical_and(dy >= -half_w, dy < half_w))
+
+    # Per-cell roi scores, same formulations as n_largest_rois_in_cell: rois not
+    # centered in the cell score -inf, a selected roi is valid exactly when its
+    # score is finite.
+    minus_inf = np.float32(-1e30)
+    if comparator == "largest_w":
+        scores = np.where(has_center, w, minus_inf)
+    elif comparator == "furthest_from_center":
+        scores = np.where(has_center, np.abs(dx) + np.abs(dy), minus_inf)
+    elif comparator == "closest_to_center":
+        scores = np.where(has_center, -(np.abs(dx) + np.abs(dy)), minus_inf)
+    else:
+        raise ValueError("Unknown comparator: " + comparator)
+
+    # n can be larger than the number of rois: pad so that there are always
+    # n candidates. The padding never wins, it also scores -inf.
+    if rois_n < n:
+        pad = n - rois_n
+        scores = np.pad(scores, [(0, 0), (0, 0), (0, pad)], 'constant', constant_values=minus_inf)
+        cxyw = np.pad(cxyw, [(0, pad), (0, 0)], 'constant')
+
+    # n best rois per cell by decreasing score, ties broken on the lowest index
+    order = np.argsort(-scores, axis=2, kind='stable')[:, :, :n]  # shape [grid_n, grid_n, n]
+    n_largest = cxyw[order]  # shape [grid_n, grid_n, n, 3]
+    # slots that picked a roi not centered in the cell (or padding) become empty rois (0,0,0)
+    roi_valid = np.take_along_axis(scores, order, axis=2) > -1e29  # shape [grid_n, grid_n, n]
+    n_largest = np.where(roi_valid[..., None], n_largest, 0.0).astype(np.float32)
+    return n_largest  # shape [grid_n, grid_n, n, 3]